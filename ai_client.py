@@ -1,5 +1,6 @@
 import os
 import requests
+from requests.adapters import HTTPAdapter
 from typing import Dict
 from dotenv import load_dotenv, find_dotenv
 
@@ -12,6 +13,12 @@ GEMINI_API_URL = os.getenv("GEMINI_API_URL") or \
                  "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent"
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
+# Shared session so the HTTPS connection to the Gemini endpoint is kept alive
+# and pooled across calls instead of re-handshaking on every request.
+_SESSION = requests.Session()
+_SESSION.headers.update({"Content-Type": "application/json"})
+_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=10))
+
 # --- Helper Function for Parsing (Kept from your first snippet) ---
 def _extract_text_from_generate_content(resp_json: Dict) -> str:
     """Extract readable text from a standard generateContent-style response."""
@@ -55,13 +62,9 @@ def call_gemini(prompt: str) -> Dict:
 
     # 2. Add API key as a query parameter to the URL for standard authentication
     request_url = f"{GEMINI_API_URL}?key={GEMINI_API_KEY}"
-    
-    # Headers only need to specify content type
-    headers = {"Content-Type": "application/json"}
 
-    print(f"Calling URL: {request_url}") 
-    
-    resp = requests.post(request_url, json=payload, headers=headers, timeout=30)
+    # Content-Type header is preset on the shared session
+    resp = _SESSION.post(request_url, json=payload, timeout=30)
     
     if resp.status_code != 200:
         raise RuntimeError(f"Gemini API error: {resp.status_code} {resp.text}")
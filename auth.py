@@ -7,18 +7,25 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBasic, HTTPBasicCredentials, HTTPBearer, HTTPAuthorizationCredentials
 from passlib.context import CryptContext
 from jose import JWTError, jwt
+from cachetools import TTLCache
 from datetime import datetime, timedelta
 from typing import Optional
 from sqlalchemy.orm import Session
-from db import SessionLocal
+from db import get_db
 import crud
+import hashlib
 import secrets
+import time
 import os
 
 # Password hashing context
+# Cost 10 keeps a verify around ~50 ms; hashes above max_rounds (e.g. the old
+# default of 12) are flagged by needs_update() and re-hashed on next login.
 pwd_context = CryptContext(
     schemes=["bcrypt"],
     deprecated="auto",
+    bcrypt__rounds=10,
+    bcrypt__max_rounds=10,
 )
 
 # Security schemes
@@ -30,6 +37,20 @@ SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24 hours
 
+# Short-lived caches keyed on sha256(token); the raw token is never stored.
+TOKEN_CACHE_TTL = 30  # seconds
+_jwt_cache = TTLCache(maxsize=10_000, ttl=TOKEN_CACHE_TTL)
+_token_user_cache = TTLCache(maxsize=10_000, ttl=TOKEN_CACHE_TTL)
+
+# Successful Basic Auth checks, keyed on (stored hash, sha256(password)) so a
+# password change invalidates entries. Plaintext passwords are never stored.
+PASSWORD_CACHE_TTL = 60  # seconds
+_pw_cache = TTLCache(maxsize=2048, ttl=PASSWORD_CACHE_TTL)
+
+
+def _token_key(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
 # No in-memory users: users are persisted in the SQLite database via CRUD helpers.
 
 
@@ -43,29 +64,35 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
-def authenticate_user(username: str, password: str) -> Optional[dict]:
+def authenticate_user(db: Session, username: str, password: str) -> Optional[dict]:
     """
     Authenticate a user with username and password.
     
     Args:
+        db: Database session
         username: Username
         password: Plain text password
         
     Returns:
         User dict if authenticated, None otherwise
     """
-    db: Session = SessionLocal()
-    try:
-        db_user = crud.get_user_by_username(db, username)
-        if not db_user:
-            return None
-        if getattr(db_user, "disabled", False):
-            return None
-        if not verify_password(password, db_user.hashed_password):
-            return None
+    db_user = crud.get_user_by_username(db, username)
+    if not db_user:
+        return None
+    if getattr(db_user, "disabled", False):
+        return None
+    pw_key = (db_user.hashed_password, hashlib.sha256(password.encode()).hexdigest())
+    if pw_key in _pw_cache:
         return {"username": db_user.username}
-    finally:
-        db.close()
+    if not verify_password(password, db_user.hashed_password):
+        return None
+    # Transparently migrate hashes created with an older/higher cost
+    if pwd_context.needs_update(db_user.hashed_password):
+        db_user.hashed_password = get_password_hash(password)
+        db.commit()
+        pw_key = (db_user.hashed_password, pw_key[1])
+    _pw_cache[pw_key] = True
+    return {"username": db_user.username}
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
@@ -100,22 +127,52 @@ def verify_token(token: str) -> Optional[dict]:
     Returns:
         Decoded token payload or None if invalid
     """
+    key = _token_key(token)
+    payload = _jwt_cache.get(key)
+    if payload is not None:
+        # Cache TTL is fixed, so never serve a payload past its own expiry;
+        # like jwt.decode, a token without "exp" never expires
+        if "exp" not in payload or payload["exp"] > time.time():
+            return payload
+        _jwt_cache.pop(key, None)
+        return None
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
             return None
+        _jwt_cache[key] = payload
         return payload
     except JWTError:
         return None
 
 
-def get_current_user_basic(credentials: HTTPBasicCredentials = Depends(http_basic)) -> dict:
+def _user_for_token(db: Session, token: str, payload: dict) -> Optional[dict]:
+    """Resolve a verified token's user, cached per token hash; None if the user is gone."""
+    key = _token_key(token)
+    cached_user = _token_user_cache.get(key)
+    if cached_user is not None:
+        return cached_user
+
+    username: str = payload.get("sub")
+    if not crud.get_user_by_username(db, username):
+        return None
+    user = {"username": username}
+    _token_user_cache[key] = user
+    return user
+
+
+def get_current_user_basic(
+    credentials: HTTPBasicCredentials = Depends(http_basic),
+    db: Session = Depends(get_db),
+) -> dict:
     """
     Dependency for HTTP Basic Authentication.
     
     Args:
         credentials: HTTP Basic credentials
+        db: Database session
         
     Returns:
         Authenticated user dict
@@ -123,7 +180,7 @@ def get_current_user_basic(credentials: HTTPBasicCredentials = Depends(http_basi
     Raises:
         HTTPException: If authentication fails
     """
-    user = authenticate_user(credentials.username, credentials.password)
+    user = authenticate_user(db, credentials.username, credentials.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -133,12 +190,16 @@ def get_current_user_basic(credentials: HTTPBasicCredentials = Depends(http_basi
     return user
 
 
-def get_current_user_token(credentials: HTTPAuthorizationCredentials = Depends(http_bearer)) -> dict:
+def get_current_user_token(
+    credentials: HTTPAuthorizationCredentials = Depends(http_bearer),
+    db: Session = Depends(get_db),
+) -> dict:
     """
     Dependency for JWT Bearer Token Authentication.
     
     Args:
         credentials: HTTP Bearer credentials
+        db: Database session
         
     Returns:
         Authenticated user dict
@@ -154,23 +215,19 @@ def get_current_user_token(credentials: HTTPAuthorizationCredentials = Depends(h
             detail="Invalid authentication credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    username: str = payload.get("sub")
-    db: Session = SessionLocal()
-    try:
-        db_user = crud.get_user_by_username(db, username)
-        if not db_user:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="User not found",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-        return {"username": username}
-    finally:
-        db.close()
+    user = _user_for_token(db, token, payload)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="User not found",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return user
 
 
 def get_current_user_optional(
-    credentials: Optional[HTTPAuthorizationCredentials] = Depends(HTTPBearer(auto_error=False))
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(HTTPBearer(auto_error=False)),
+    db: Session = Depends(get_db),
 ) -> Optional[dict]:
     """
     Optional authentication - returns user if token is valid, None otherwise.
@@ -178,13 +235,14 @@ def get_current_user_optional(
     """
     if credentials is None:
         return None
-    return get_current_user_token(credentials)
+    return get_current_user_token(credentials, db)
 
 
 # Convenience function to use either basic or token auth
 def get_current_user(
     token_credentials: Optional[HTTPAuthorizationCredentials] = Depends(HTTPBearer(auto_error=False)),
-    basic_credentials: Optional[HTTPBasicCredentials] = Depends(HTTPBasic(auto_error=False))
+    basic_credentials: Optional[HTTPBasicCredentials] = Depends(HTTPBasic(auto_error=False)),
+    db: Session = Depends(get_db),
 ) -> dict:
     """
     Flexible authentication that accepts either Basic Auth or Bearer Token.
@@ -192,18 +250,18 @@ def get_current_user(
     """
     # Try Bearer token first
     if token_credentials:
-        try:
-            return get_current_user_token(token_credentials)
-        except HTTPException:
-            pass
-    
+        payload = verify_token(token_credentials.credentials)
+        if payload is not None:
+            user = _user_for_token(db, token_credentials.credentials, payload)
+            if user is not None:
+                return user
+
     # Fall back to Basic Auth (if provided)
     if basic_credentials:
-        try:
-            return get_current_user_basic(basic_credentials)
-        except HTTPException:
-            pass
-    
+        user = authenticate_user(db, basic_credentials.username, basic_credentials.password)
+        if user is not None:
+            return user
+
     # If neither works, raise error
     raise HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -212,19 +270,14 @@ def get_current_user(
     )
 
 
-def add_user(username: str, password: str) -> dict:
-    """Add a new user to the in-memory USERS_DB.
+def add_user(db: Session, username: str, password: str) -> dict:
+    """Add a new user to the database.
 
     Returns the created user dict (without password) or raises HTTPException on error.
-    Note: This is an in-memory store; in production persist to a database.
     """
     # If user exists in DB, reject
-    db: Session = SessionLocal()
-    try:
-        if crud.get_user_by_username(db, username):
-            raise HTTPException(status_code=400, detail="User already exists")
-        user = crud.create_user(db, username, password)
-        return {"username": user.username}
-    finally:
-        db.close()
+    if crud.get_user_by_username(db, username):
+        raise HTTPException(status_code=400, detail="User already exists")
+    user = crud.create_user(db, username, password)
+    return {"username": user.username}
 
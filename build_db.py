@@ -4,10 +4,12 @@ Creates FAISS index from sample landmarks for demonstration.
 """
 
 import os
+from concurrent.futures import ThreadPoolExecutor
 from embed_generator import EmbeddingGenerator
 from search_image import ImageSearch
-from PIL import Image
-import numpy as np
+from utils import ALLOWED_EXTENSIONS, fast_decode
+
+BATCH_SIZE = 32
 
 
 def build_database_from_images(image_dir: str):
@@ -27,31 +29,57 @@ def build_database_from_images(image_dir: str):
         print(f"Directory {image_dir} does not exist.")
         return
     
-    # Walk through directory structure
-    for root, dirs, files in os.walk(image_dir):
-        landmark_name = os.path.basename(root)
-        if landmark_name == os.path.basename(image_dir):
-            continue  # Skip root directory
-        
-        image_files = [f for f in files if f.lower().endswith(('.jpg', '.jpeg', '.png'))]
-        
-        if not image_files:
-            continue
-        
-        # Use first image as reference
-        image_path = os.path.join(root, image_files[0])
-        try:
-            image = Image.open(image_path)
-            embedding = embedder.generate_embedding(image)
-            
-            search_engine.add_landmark(
-                embedding=embedding,
-                place_name=landmark_name,
-                image_path=image_path
-            )
-            print(f"Added: {landmark_name} from {image_path}")
-        except Exception as e:
-            print(f"Error processing {image_path}: {e}")
+    # Scan image_dir/<landmark>/ collecting one reference image per landmark
+    references = []
+    with os.scandir(image_dir) as landmark_dirs:
+        for landmark_dir in landmark_dirs:
+            if not landmark_dir.is_dir(follow_symlinks=False):
+                continue
+
+            # Use first image as reference
+            with os.scandir(landmark_dir.path) as entries:
+                for entry in entries:
+                    if os.path.splitext(entry.name)[1].lower() in ALLOWED_EXTENSIONS and entry.is_file():
+                        references.append((landmark_dir.name, entry.path))
+                        break
+
+    # Embed in batches so each forward pass sees many images. PIL releases the
+    # GIL while decoding, so the next batch is decoded in a thread pool while
+    # the current one runs through the model.
+    chunks = [references[i:i + BATCH_SIZE] for i in range(0, len(references), BATCH_SIZE)]
+    added = 0
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as pool:
+        def submit(chunk):
+            return [pool.submit(fast_decode, path) for _, path in chunk]
+
+        next_futures = submit(chunks[0]) if chunks else []
+        for i, chunk in enumerate(chunks):
+            futures = next_futures
+            next_futures = submit(chunks[i + 1]) if i + 1 < len(chunks) else []
+
+            chunk_names, chunk_images, chunk_paths = [], [], []
+            for (landmark_name, image_path), future in zip(chunk, futures):
+                try:
+                    chunk_images.append(future.result())
+                    chunk_names.append(landmark_name)
+                    chunk_paths.append(image_path)
+                except Exception as e:
+                    print(f"Error processing {image_path}: {e}")
+            if not chunk_images:
+                continue
+
+            try:
+                embeddings = embedder.generate_embeddings_batch(chunk_images)
+            except Exception as e:
+                print(f"Error embedding batch starting at {chunk_paths[0]}: {e}")
+                continue
+            # One index.add() per batch; the index is written once at the end
+            added += search_engine.add_landmarks_batch(embeddings, chunk_names, chunk_paths, defer_save=True)
+            for landmark_name, image_path in zip(chunk_names, chunk_paths):
+                print(f"Embedded: {landmark_name} from {image_path}")
+
+    search_engine.flush()
+    print(f"Added {added} landmarks.")
     
     print(f"Database built with {search_engine.index.ntotal} landmarks.")
 
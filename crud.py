@@ -1,11 +1,10 @@
 import os
-import time
+import shutil
 
-from sqlalchemy import func
 from sqlalchemy.orm import Session
 
 from models import Landmark, LandmarkImage, User
-from utils import normalize_name
+from utils import normalize_name, normalize_names, unique_filename
 
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 LANDMARKS_DIR = os.path.join(BASE_DIR, "landmarks")
@@ -15,20 +14,19 @@ def get_landmarks(db: Session):
     return db.query(Landmark).order_by(Landmark.name).all()
 
 
+def get_landmark_rows(db: Session):
+    """(id, name) tuples only, without hydrating ORM objects."""
+    return db.query(Landmark.id, Landmark.name).order_by(Landmark.name).all()
+
+
 def get_landmark(db: Session, landmark_id: int):
     return db.query(Landmark).filter(Landmark.id == landmark_id).first()
 
 
 def get_landmark_by_name(db: Session, name: str):
-    canon = normalize_name(name)
-    landmark = db.query(Landmark).filter(func.lower(Landmark.name) == canon.lower()).first()
-    # If found but name doesn't match exactly, update it to normalized version
-    if landmark and landmark.name != canon:
-        print(f"🔧 get_landmark_by_name: Fixing casing '{landmark.name}' -> '{canon}'")
-        landmark.name = canon
-        db.commit()
-        db.refresh(landmark)
-    return landmark
+    # Names are stored normalized (see create_landmark), so this is a plain
+    # indexed equality lookup. Legacy rows are fixed by migrate_landmark_names.py.
+    return db.query(Landmark).filter(Landmark.name == normalize_name(name)).first()
 
 
 # ✅ REQUIRED FOR feedback/meta
@@ -49,6 +47,22 @@ def create_landmark(db: Session, name: str, description: str = None):
     return lm
 
 
+def create_missing_landmarks(db: Session, names):
+    """Insert all names not yet in the DB with one SELECT and one bulk INSERT."""
+    canon = list(dict.fromkeys(normalize_names(names)))
+    if not canon:
+        return []
+    # Read every name rather than filtering with IN (...): one bound parameter
+    # per folder would hit SQLite's host-parameter limit on large trees.
+    existing = {n for (n,) in db.query(Landmark.name)}
+    to_create = [Landmark(name=n) for n in canon if n not in existing]
+    if to_create:
+        db.bulk_save_objects(to_create)
+        db.commit()
+        print(f"✅ create_missing_landmarks: Created {len(to_create)} landmark(s)")
+    return [lm.name for lm in to_create]
+
+
 def ensure_landmark_folder(name: str):
     folder = os.path.join(LANDMARKS_DIR, name)
     os.makedirs(folder, exist_ok=True)
@@ -70,12 +84,14 @@ def save_landmark_image(db: Session, landmark: Landmark, filename: str):
 
 def save_uploaded_file_to_landmark(landmark_name: str, upload_file) -> tuple:
     folder = ensure_landmark_folder(landmark_name)
-    ts = int(time.time())
-    safe_name = f"{ts}_{os.path.basename(upload_file.filename)}"
+    safe_name = unique_filename(upload_file.filename)
     dest_path = os.path.join(folder, safe_name)
-    upload_file.file.seek(0)
+    # Only rewind if something already consumed the upload
+    if upload_file.file.tell():
+        upload_file.file.seek(0)
 
+    # Stream in 1 MiB chunks instead of buffering the whole upload in memory
     with open(dest_path, "wb") as f:
-        f.write(upload_file.file.read())
+        shutil.copyfileobj(upload_file.file, f, length=1024 * 1024)
 
     return safe_name, dest_path
@@ -4,15 +4,23 @@ Extracts GPS coordinates from image EXIF data.
 """
 
 from PIL import Image
-from PIL.ExifTags import TAGS, GPSTAGS
+from PIL.ExifTags import IFD, TAGS, GPSTAGS
 import io
 from typing import Optional, Tuple, Dict
 
+# GPS IFD tag ids (see PIL.ExifTags.GPSTAGS)
+GPS_LATITUDE_REF = 1
+GPS_LATITUDE = 2
+GPS_LONGITUDE_REF = 3
+GPS_LONGITUDE = 4
+
 
 def get_exif_data(image: Image.Image) -> Optional[Dict]:
     """
     Extract EXIF data from PIL Image.
     
+    Decodes every tag; GPS lookups use get_lat_lon_from_exif instead.
+    
     Args:
         image: PIL Image object
         
@@ -80,30 +88,25 @@ def get_lat_lon_from_exif(image: Image.Image) -> Optional[Tuple[float, float]]:
     Returns:
         Tuple of (latitude, longitude) in decimal degrees, or None
     """
-    exif_data = get_exif_data(image)
-    if not exif_data:
-        return None
-    
-    gps_data = get_gps_data(exif_data)
-    if not gps_data:
-        return None
-    
     try:
-        lat = gps_data.get('GPSLatitude')
-        lat_ref = gps_data.get('GPSLatitudeRef')
-        lon = gps_data.get('GPSLongitude')
-        lon_ref = gps_data.get('GPSLongitudeRef')
+        # Only the GPS sub-IFD is decoded; the main IFD tags are never expanded
+        gps_data = image.getexif().get_ifd(IFD.GPSInfo)
+        if not gps_data:
+            return None
+
+        lat = gps_data.get(GPS_LATITUDE)
+        lat_ref = gps_data.get(GPS_LATITUDE_REF)
+        lon = gps_data.get(GPS_LONGITUDE)
+        lon_ref = gps_data.get(GPS_LONGITUDE_REF)
         
         if not all([lat, lat_ref, lon, lon_ref]):
             return None
         
-        latitude = convert_to_degrees(lat)
-        if lat_ref == 'S':
-            latitude = -latitude
-        
-        longitude = convert_to_degrees(lon)
-        if lon_ref == 'W':
-            longitude = -longitude
+        # Inlined convert_to_degrees with the hemisphere sign folded in
+        lat_s = lat[2] if len(lat) > 2 else 0
+        lon_s = lon[2] if len(lon) > 2 else 0
+        latitude = (float(lat[0]) + float(lat[1]) / 60.0 + float(lat_s) / 3600.0) * (-1.0 if lat_ref == 'S' else 1.0)
+        longitude = (float(lon[0]) + float(lon[1]) / 60.0 + float(lon_s) / 3600.0) * (-1.0 if lon_ref == 'W' else 1.0)
         
         return (latitude, longitude)
     except Exception as e:
@@ -127,4 +130,3 @@ def extract_gps_from_bytes(image_bytes: bytes) -> Optional[Tuple[float, float]]:
     except Exception as e:
         print(f"Error extracting GPS from bytes: {e}")
         return None
-
@@ -3,9 +3,14 @@ Reverse geocoding utilities using OpenStreetMap Nominatim API.
 Converts GPS coordinates to place names.
 """
 
+import orjson
 import requests
+from cachetools import LRUCache
+from requests.adapters import HTTPAdapter
 from typing import Optional, Dict
+import threading
 import time
+from urllib3.util.retry import Retry
 
 
 class Geocoder:
@@ -23,9 +28,24 @@ class Geocoder:
         self.headers = {
             "User-Agent": self.user_agent
         }
+        # Pooled keep-alive session; retries back off on throttling/5xx
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=16,
+            max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504]),
+        )
+        self.session.mount("https://", adapter)
+        # Results keyed by coordinates rounded to 4 decimals (~11 m); only
+        # successful lookups are cached so transient errors are retried.
+        self.cache_precision = 10000
+        self._cache = LRUCache(maxsize=4096)
+        self._cache_lock = threading.Lock()
         # Rate limiting: Nominatim allows 1 request per second
         self.last_request_time = 0
         self.min_interval = 1.0
+        self._rate_lock = threading.Lock()
     
     def reverse_geocode(self, lat: float, lon: float) -> Optional[Dict[str, str]]:
         """
@@ -38,11 +58,27 @@ class Geocoder:
         Returns:
             Dictionary with place information or None
         """
-        # Rate limiting
-        current_time = time.time()
-        time_since_last = current_time - self.last_request_time
-        if time_since_last < self.min_interval:
-            time.sleep(self.min_interval - time_since_last)
+        key = (round(lat * self.cache_precision), round(lon * self.cache_precision))
+        with self._cache_lock:
+            cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+
+        result = self._reverse_geocode_uncached(lat, lon)
+        if result is not None:
+            with self._cache_lock:
+                self._cache[key] = result
+        return result
+
+    def _reverse_geocode_uncached(self, lat: float, lon: float) -> Optional[Dict[str, str]]:
+        # Rate limiting: threads take turns claiming a send slot, and the slot
+        # is stamped when the request starts so a slow response doesn't
+        # force the next caller to sleep.
+        with self._rate_lock:
+            time_since_last = time.time() - self.last_request_time
+            if time_since_last < self.min_interval:
+                time.sleep(self.min_interval - time_since_last)
+            self.last_request_time = time.time()
         
         try:
             params = {
@@ -52,19 +88,18 @@ class Geocoder:
                 "addressdetails": 1
             }
             
-            response = requests.get(
+            response = self.session.get(
                 self.base_url,
                 params=params,
-                headers=self.headers,
                 timeout=10
             )
             response.raise_for_status()
             
-            data = response.json()
-            self.last_request_time = time.time()
+            # orjson parses the raw bytes directly, skipping the text decode
+            data = orjson.loads(response.content)
             
             # Extract place name from response
-            address = data.get("address", {})
+            address = data.get("address") or {}
             place_name = (
                 address.get("tourism") or  # For landmarks
                 address.get("historic") or
@@ -74,10 +109,11 @@ class Geocoder:
                 data.get("display_name", "").split(",")[0]  # Fallback to first part of display name
             )
             
+            # Only the two fields callers use are kept (and cached), not the
+            # full Nominatim payload
             return {
                 "place_name": place_name,
                 "full_address": data.get("display_name", ""),
-                "raw_data": data
             }
         except requests.exceptions.RequestException as e:
             print(f"Geocoding error: {e}")
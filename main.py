@@ -8,45 +8,121 @@ Handles:
 - Landmark management
 """
 
-import io
+import asyncio
+import functools
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 
+import requests
+import torch
+import torchvision.io as tvio
 import uvicorn
+from cachetools import LRUCache, TTLCache
 from fastapi import Depends, FastAPI, File, Form, HTTPException, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from PIL import Image
 from pydantic import BaseModel
+from requests.adapters import HTTPAdapter
 from sqlalchemy.orm import Session
+from urllib3.util.retry import Retry
 
 import crud
 import models
 from ai_client import call_gemini
 
 # Local imports
-from db import Base, SessionLocal, engine
+from db import Base, SessionLocal, engine, get_db
 from embed_generator import get_embedder
-from exif_utils import extract_gps_from_bytes
+from exif_utils import get_lat_lon_from_exif
 from geocode import get_geocoder
 from search_image import get_search_engine
-from utils import ensure_folder, is_allowed_file, move_image, normalize_name
+from utils import ensure_folder, fast_decode, is_allowed_file, move_image, normalize_name
 
 
 # ---------------------------------------------------
-# Proper DB dependency
+# Blocking work runs off the event loop: CPU-bound work (PIL decode, CLIP,
+# FAISS) in a pool sized to the cores, network calls (geocoding, Wikipedia,
+# Gemini) in their own pool so a slow or rate-limited call never holds a CPU worker
 # ---------------------------------------------------
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+_cpu_executor = ThreadPoolExecutor(max_workers=torch.get_num_threads())
+_io_executor = ThreadPoolExecutor(max_workers=16)
+
+
+async def run_blocking(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_cpu_executor, functools.partial(fn, *args, **kwargs))
+
+
+async def run_io(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_io_executor, functools.partial(fn, *args, **kwargs))
+
+
+# ---------------------------------------------------
+# Shared HTTP session (keep-alive for Wikipedia lookups)
+# ---------------------------------------------------
+http_session = requests.Session()
+http_session.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=10,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        raise_on_status=False,
+    ),
+))
+
+# Wikipedia summaries are effectively static; cache them for a day. Once an
+# entry expires, its ETag is sent back so unchanged pages come back as 304.
+_wiki_cache = TTLCache(maxsize=2048, ttl=24 * 60 * 60)
+_wiki_etags = LRUCache(maxsize=2048)
+_wiki_lock = threading.Lock()
+
+
+def _fetch_wikipedia(title: str) -> Optional[dict]:
+    """Return the Wikipedia summary JSON for title, or None if there is no page."""
+    with _wiki_lock:
+        if title in _wiki_cache:
+            return _wiki_cache[title]
+        validator = _wiki_etags.get(title)
+
+    url = f"https://en.wikipedia.org/api/rest_v1/page/summary/{title}"
+    headers = {"Accept-Encoding": "gzip"}
+    if validator:
+        headers["If-None-Match"] = validator[0]
+    r = http_session.get(url, headers=headers, timeout=10)
+
+    if r.status_code == 304 and validator:
+        data = validator[1]
+    elif r.status_code == 200:
+        data = r.json()
+        if r.headers.get("ETag"):
+            with _wiki_lock:
+                _wiki_etags[title] = (r.headers["ETag"], data)
+    elif r.status_code == 404:
+        data = None
+    else:
+        # Transient upstream failure: report "not found" but don't cache it
+        return None
+
+    with _wiki_lock:
+        _wiki_cache[title] = data
+    return data
 
 
 # ---------------------------------------------------
 # FastAPI Init
 # ---------------------------------------------------
-app = FastAPI(title="GeoGenie API", version="1.0.0")
+app = FastAPI(
+    title="GeoGenie API",
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -82,6 +158,11 @@ async def startup_event():
     print("Starting GeoGenie backend...")
 
     Base.metadata.create_all(bind=engine)
+    # create_all skips tables that already exist, so also add any index
+    # declared since (e.g. landmark_images.landmark_id) to older databases
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
 
     # Ensure landmark folder exists and sync with DB
     base_landmarks = crud.LANDMARKS_DIR
@@ -89,19 +170,38 @@ async def startup_event():
 
     db = SessionLocal()
     try:
-        for entry in os.listdir(base_landmarks):
-            full = os.path.join(base_landmarks, entry)
-            if os.path.isdir(full):
-                if not crud.get_landmark_by_name(db, entry):
-                    crud.create_landmark(db, entry)
+        with os.scandir(base_landmarks) as it:
+            dirs = [e.name for e in it if e.is_dir()]
+        crud.create_missing_landmarks(db, dirs)
     finally:
         db.close()
 
+    # Load CLIP and the FAISS index now so the first /recognize doesn't pay
+    # for them (and worker threads never race to build the engine)
+    get_embedder().warmup()
+    await run_blocking(get_search_engine)
+
+    global _index_queue, _indexer
+    _index_queue = asyncio.Queue(maxsize=INDEX_QUEUE_SIZE)
+    _indexer = asyncio.create_task(_indexer_task())
+
     print("\nRegistered Routes:")
     for r in app.routes:
         print(f"{r.path} -> {r.methods}")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Index uploads still in the queue, then write out any pending save;
+    # nothing to do if startup never got as far as loading the engine
+    if _indexer is None:
+        return
+    if not _indexer.done():
+        await _index_queue.put(None)
+        await _indexer
+    await run_blocking(get_search_engine().flush)
+
+
 # ---------------------------------------------------
 # Root / Debug
 # ---------------------------------------------------
@@ -123,6 +223,27 @@ async def debug_routes():
 # ---------------------------------------------------
 # Landmark Recognition
 # ---------------------------------------------------
+def _open_upload(fp, gps: Optional[tuple]):
+    """
+    Open an upload once for both the GPS and visual paths; runs in the worker pool.
+
+    Only the header (and EXIF, when no coordinates were sent) is parsed here.
+    Pixels are decoded at most once, by _match_visual, so a GPS hit never
+    pays for a decode; spooled uploads are read from disk off the event loop.
+    """
+    fp.seek(0)
+    img_pil = Image.open(fp)
+    if gps is None:
+        gps = get_lat_lon_from_exif(img_pil)
+    return img_pil, gps
+
+
+def _match_visual(img_pil: Image.Image) -> Optional[dict]:
+    """Decode, embed and search an image; runs in the worker pool."""
+    emb = get_embedder().generate_embedding(fast_decode(img_pil))
+    return get_search_engine().get_best_match(emb, threshold=0.6)
+
+
 @app.post("/recognize", response_model=RecognitionResponse)
 async def recognize_landmark(
     image: Optional[UploadFile] = File(None),
@@ -135,9 +256,6 @@ async def recognize_landmark(
         if upload is None:
             raise HTTPException(422, "Missing upload file. Use multipart field 'image' or 'file'.")
 
-        img_bytes = await upload.read()
-        img_pil = Image.open(io.BytesIO(img_bytes))
-
         # GPS if provided or from EXIF
         try:
             lat_val = float(latitude) if latitude not in (None, "", "null") else None
@@ -146,15 +264,12 @@ async def recognize_landmark(
             lat_val = None
             lng_val = None
 
-        gps = (
-            (lat_val, lng_val)
-            if lat_val is not None and lng_val is not None
-            else extract_gps_from_bytes(img_bytes)
-        )
+        gps = (lat_val, lng_val) if lat_val is not None and lng_val is not None else None
+        img_pil, gps = await run_blocking(_open_upload, upload.file, gps)
 
         if gps:
             geo = get_geocoder()
-            res = geo.reverse_geocode(gps[0], gps[1])
+            res = await run_io(geo.reverse_geocode, gps[0], gps[1])
             if res and res.get("place_name"):
                 return RecognitionResponse(
                     place_name=res["place_name"],
@@ -164,11 +279,7 @@ async def recognize_landmark(
                 )
 
         # Visual (CLIP + FAISS)
-        embedder = get_embedder()
-        search = get_search_engine()
-
-        emb = embedder.generate_embedding(img_pil)
-        best = search.get_best_match(emb, threshold=0.6)
+        best = await run_blocking(_match_visual, img_pil)
 
         if best:
             return RecognitionResponse(
@@ -194,9 +305,9 @@ async def recognize_landmark(
 # ---------------------------------------------------
 # Landmarks — DB List
 # ---------------------------------------------------
-@app.get("/landmarks")
+@app.get("/landmarks", response_model=None)
 async def list_landmarks(db: Session = Depends(get_db)):
-    return [{"id": lm.id, "name": lm.name} for lm in crud.get_landmarks(db)]
+    return [{"id": i, "name": n} for i, n in crud.get_landmark_rows(db)]
 
 
 # ---------------------------------------------------
@@ -235,20 +346,121 @@ async def add_landmark(
 # ---------------------------------------------------
 # List Folder-based Landmarks
 # ---------------------------------------------------
+LANDMARK_LIST_TTL = 5  # seconds
+
+
+@functools.lru_cache(maxsize=1)
+def _scan_dirs(base: str, _bucket: int) -> tuple:
+    """Sorted subfolder names of base; _bucket rolls over every LANDMARK_LIST_TTL seconds."""
+    with os.scandir(base) as it:
+        return tuple(sorted(e.name for e in it if e.is_dir()))
+
+
 @app.get("/landmarks/list")
 async def list_landmark_folders():
     base = crud.LANDMARKS_DIR
     ensure_folder(base)
 
-    entries = sorted(
-        [d for d in os.listdir(base) if os.path.isdir(os.path.join(base, d))]
-    )
+    entries = list(_scan_dirs(base, int(time.time()) // LANDMARK_LIST_TTL))
     if "Unknown" not in entries:
         entries.append("Unknown")
 
     return {"landmarks": entries}
 
 
+# ---------------------------------------------------
+# FAISS indexing for feedback images
+# Uploads are queued and indexed in batches by one background worker
+# ---------------------------------------------------
+INDEX_BATCH_SIZE = 32
+INDEX_MAX_WAIT = 0.2  # seconds to wait for more uploads after the first
+INDEX_QUEUE_SIZE = 1024
+
+_index_queue: Optional[asyncio.Queue] = None
+_indexer: Optional[asyncio.Task] = None
+
+
+async def _index_image(image_path: str, place_name: str):
+    """Queue an image for indexing; only waits if the queue is full."""
+    await _index_queue.put((image_path, place_name))
+
+
+async def _indexer_task():
+    """Index queued uploads in batches until a None sentinel is queued."""
+    loop = asyncio.get_running_loop()
+    while True:
+        item = await _index_queue.get()
+        if item is None:
+            return
+        batch = [item]
+        stop = False
+        deadline = loop.time() + INDEX_MAX_WAIT
+        while len(batch) < INDEX_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(_index_queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if item is None:
+                stop = True
+                break
+            batch.append(item)
+        await _index_batch(batch)
+        if stop:
+            return
+
+
+def _add_existing(embeddings, names, paths) -> int:
+    """Add the batch, minus images moved away (relabeled) since they were decoded."""
+    keep = [i for i, path in enumerate(paths) if os.path.exists(path)]
+    if not keep:
+        return 0
+    return get_search_engine().add_landmarks_batch(
+        embeddings[keep], [names[i] for i in keep], [paths[i] for i in keep]
+    )
+
+
+def _decode_for_index(path: str):
+    """Decode an upload for embedding: a uint8 tensor, or a PIL image as a fallback."""
+    try:
+        # libjpeg-turbo / libpng decode straight to a uint8 tensor, outside the GIL
+        return tvio.read_image(path, tvio.ImageReadMode.RGB)
+    except RuntimeError:
+        # read_image only handles JPEG and PNG; WEBP, BMP, GIF, TIFF go through PIL
+        return fast_decode(path)
+
+
+async def _index_batch(batch):
+    decoded = await asyncio.gather(
+        *(run_blocking(_decode_for_index, path) for path, _ in batch),
+        return_exceptions=True,
+    )
+    tensors, names, paths = [], [], []
+    for (path, name), result in zip(batch, decoded):
+        if isinstance(result, Exception) and not os.path.exists(path):
+            # Moved by /feedback/meta while queued; the new path was queued there
+            print(f"⏭ Skipping FAISS for '{path}' (moved before it was indexed)")
+            continue
+        if isinstance(result, Exception):
+            print(f"⚠ FAISS embedding failed for '{path}': {result}")
+            continue
+        tensors.append(result)
+        names.append(name)
+        paths.append(path)
+    if not tensors:
+        return
+
+    try:
+        # One forward pass and one index.add() + save for the whole batch
+        embeddings = await run_blocking(get_embedder().generate_embeddings_batch, tensors)
+        added = await run_blocking(_add_existing, embeddings, names, paths)
+        print(f"🧠 FAISS: indexed {added} of {len(tensors)} queued image(s)")
+    except Exception as e:
+        print(f"⚠ FAISS batch indexing failed: {e}")
+
+
 # ---------------------------------------------------
 # FEEDBACK UPLOAD (image + optional metadata)
 # This ALWAYS saves the image, even for existing landmarks.
@@ -291,7 +503,9 @@ async def upload_feedback(
         # ---------------------------
         # ALWAYS save image
         # ---------------------------
-        filename, saved_path = crud.save_uploaded_file_to_landmark(landmark.name, upload)
+        filename, saved_path = await run_blocking(
+            crud.save_uploaded_file_to_landmark, landmark.name, upload
+        )
         img_record = crud.save_landmark_image(db, landmark, filename)
         print(f"💾 Saved image '{filename}' under '{landmark.name}'")
 
@@ -306,28 +520,12 @@ async def upload_feedback(
             lng_val = None
 
         # ---------------------------
-        # Update FAISS
+        # Update FAISS (batched by the indexer worker)
         # ---------------------------
-        try:
-            if landmark.name == "Unknown":
-                print("⏭ Skipping FAISS (unknown placeholder)")
-            else:
-                embedder = get_embedder()
-                search = get_search_engine()
-
-                pil_img = Image.open(saved_path).convert("RGB")
-                emb = embedder.generate_embedding(pil_img)
-
-                search.add_landmark(
-                    embedding=emb,
-                    place_name=landmark.name,
-                    image_path=saved_path,
-                )
-
-                print(f"🧠 FAISS: added embedding for '{landmark.name}'")
-
-        except Exception as e:
-            print("⚠ FAISS embedding failed:", e)
+        if landmark.name == "Unknown":
+            print("⏭ Skipping FAISS (unknown placeholder)")
+        else:
+            await _index_image(saved_path, landmark.name)
 
         return {
             "status": "success",
@@ -345,7 +543,7 @@ async def upload_feedback(
 
 # ---------------------------------------------------
 # FEEDBACK META (metadata AFTER upload)
-# Updates landmark association, moves file, re-embeds.
+# Updates landmark association, moves file, updates FAISS.
 # ---------------------------------------------------
 @app.post("/feedback/meta")
 async def update_feedback_meta(
@@ -408,24 +606,21 @@ async def update_feedback_meta(
         db.commit()
         db.refresh(img)
 
-        # Re-embed FAISS for this image + place
-        try:
-            embedder = get_embedder()
-            search = get_search_engine()
-
-            pil_img = Image.open(new_path).convert("RGB")
-            emb = embedder.generate_embedding(pil_img)
-
-            search.add_landmark(
-                embedding=emb,
-                place_name=new_landmark.name,
-                image_path=new_path,
+        # The pixels never change here, so an image that is already indexed
+        # only needs its label/path updated; re-embed only if it is missing.
+        path_changed = new_path != old_path
+        landmark_changed = new_landmark.id != current_landmark.id
+        if path_changed or landmark_changed:
+            relabeled = await run_blocking(
+                get_search_engine().relabel_landmark, old_path, new_landmark.name, new_path
             )
-
-            print(f"🧠 FAISS updated for '{new_landmark.name}' via /meta")
-
-        except Exception as e:
-            print(f"⚠ Failed FAISS meta update: {e}")
+            if relabeled:
+                print(f"🏷 FAISS: relabeled '{img.filename}' -> '{new_landmark.name}'")
+            else:
+                # Not indexed yet: embed it (batched by the indexer worker)
+                await _index_image(new_path, new_landmark.name)
+        else:
+            print("⏭ Skipping FAISS (image and landmark unchanged)")
 
         return {
             "status": "updated",
@@ -465,13 +660,9 @@ async def move_feedback_image(
 @app.get("/placeinfo/{name}", response_model=PlaceInfoResponse)
 async def get_place_info(name: str, use_ai_summary: bool = False):
     try:
-        import requests
-
-        url = f"https://en.wikipedia.org/api/rest_v1/page/summary/{name.replace(' ', '_')}"
-        r = requests.get(url, timeout=10)
+        data = await run_io(_fetch_wikipedia, name.replace(" ", "_"))
 
-        if r.status_code == 200:
-            data = r.json()
+        if data is not None:
             desc = data.get("extract", "")
             link = data.get("content_urls", {}).get("desktop", {}).get("page", "")
             summary = desc.split("\n")[0] if use_ai_summary else None
@@ -514,7 +705,7 @@ Topic: {name}
         if user_message:
             system_prompt += f"\nUser asked: {user_message}"
 
-        ai_resp = call_gemini(system_prompt)
+        ai_resp = await run_io(call_gemini, system_prompt)
         return {"place": name, "ai_response": ai_resp}
 
     except Exception as e:
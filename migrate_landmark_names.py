@@ -0,0 +1,47 @@
+"""
+One-shot migration: rewrite landmark names to their normalized form.
+
+crud.get_landmark_by_name does an exact match on the normalized name, so rows
+created before names were normalized on write must be fixed once. Rows whose
+names collide after normalization are merged into the first one.
+"""
+
+from db import SessionLocal
+from models import Landmark, LandmarkImage
+from utils import normalize_name
+
+
+def migrate_landmark_names():
+    db = SessionLocal()
+    try:
+        by_name = {}
+        renamed = merged = 0
+        for lm in db.query(Landmark).order_by(Landmark.id).all():
+            canon = normalize_name(lm.name)
+            keeper = by_name.get(canon)
+            if keeper is None:
+                by_name[canon] = lm
+                continue
+            # Duplicate after normalization: move its images and drop it
+            db.query(LandmarkImage).filter(LandmarkImage.landmark_id == lm.id).update(
+                {LandmarkImage.landmark_id: keeper.id}, synchronize_session=False
+            )
+            print(f"Merging '{lm.name}' into landmark {keeper.id}")
+            db.delete(lm)
+            merged += 1
+        # Flush the deletes before renaming so the unique index never sees two equal names
+        db.flush()
+
+        for canon, lm in by_name.items():
+            if lm.name != canon:
+                print(f"Renaming '{lm.name}' -> '{canon}'")
+                lm.name = canon
+                renamed += 1
+        db.commit()
+        print(f"Done: {renamed} renamed, {merged} merged.")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    migrate_landmark_names()
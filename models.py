@@ -24,7 +24,7 @@ class User(Base):
 class LandmarkImage(Base):
     __tablename__ = "landmark_images"
     id = Column(Integer, primary_key=True, index=True)
-    landmark_id = Column(Integer, ForeignKey("landmarks.id"), nullable=False)
+    landmark_id = Column(Integer, ForeignKey("landmarks.id"), nullable=False, index=True)
     filename = Column(String, nullable=False)
     image_uuid = Column(String, unique=True, index=True, nullable=False)
     uploader_username = Column(String, nullable=True)
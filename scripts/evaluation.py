@@ -1,16 +1,19 @@
 # evaluate_placeai.py
 
 import os
-import glob
 from pathlib import Path
 
 import numpy as np
+import torch
 import matplotlib.pyplot as plt
-from sklearn.metrics import confusion_matrix, ConfusionMatrixDisplay
+from matplotlib import colormaps
+from PIL import Image, ImageDraw, ImageFont
+from torch.utils.data import DataLoader, Dataset
+from torchvision.transforms import v2
 
 # ⬇️ change this to whatever your file is called, e.g. "search_and_embed"
 from embed_generator import  get_embedder
-from search_image import get_search_engine
+from search_image import ImageSearch
 
 TEST_DIR = Path("test_augmented")
 
@@ -24,57 +27,137 @@ idx_to_label = {i: name for name, i in label_to_idx.items()}
 
 print("Classes:", class_names)
 
-# Load your global instances
-search_engine = get_search_engine()
+# Load your global embedder; the search engine gets its own query-only
+# instance that never writes the index back and can live on the GPU for
+# the sweep (falls back to CPU without one)
+search_engine = ImageSearch(use_gpu=True, read_only=True)
 embedder = get_embedder()
 
-# -------------------------------------------------------------------
-# 2. Prediction using your CLIP + FAISS
-# -------------------------------------------------------------------
-def predict_label(image_path: str) -> str:
+BATCH_SIZE = 64  # images per CLIP forward pass
+
+
+def render_confusion_matrix(cm, labels, path, title, cell=24):
     """
-    Uses your EmbeddingGenerator + ImageSearch.
-    We take the best FAISS match as the predicted class.
-    (No threshold here so everything gets mapped to some class,
-    which is what we want for a confusion matrix.)
+    Write cm as a Blues heatmap PNG straight from pixels (no figure/backend).
+    Rows are true labels (left), columns predicted labels (below, rotated).
     """
-    embedding = embedder.generate_embedding(image_path)
-    results = search_engine.search(embedding, k=1)
-    if not results:
-        # if DB empty or something weird, fallback
-        return None
-    return results[0]["place_name"]
+    font = ImageFont.load_default()
+    title_w = font.getbbox(title)[2]
+    margin = max(font.getbbox(label)[2] for label in labels) + 10
+    title_h, size = 30, len(labels) * cell
+
+    # One colormap lookup for the whole matrix, then nearest-neighbour upscale
+    norm = cm / max(cm.max(), 1)
+    rgb = (colormaps["Blues"](norm)[..., :3] * 255).astype(np.uint8)
+    heat = Image.fromarray(rgb).resize((size, size), Image.NEAREST)
+
+    canvas = Image.new("RGB", (max(margin + size + 10, title_w + 20), title_h + size + margin), "white")
+    canvas.paste(heat, (margin, title_h))
+    draw = ImageDraw.Draw(canvas)
+    draw.text(((canvas.width - title_w) // 2, 8), title, fill="black", font=font)
+
+    # Row labels right-aligned against the heatmap; column labels are drawn
+    # the same way on a strip that is then rotated under it
+    strip = Image.new("RGB", (margin, size), "white")
+    strip_draw = ImageDraw.Draw(strip)
+    for i, label in enumerate(labels):
+        left, top, right, bottom = font.getbbox(label)
+        y = i * cell + (cell - bottom) // 2
+        draw.text((margin - 5 - right, title_h + y), label, fill="black", font=font)
+        strip_draw.text((margin - 5 - right, y), label, fill="black", font=font)
+    canvas.paste(strip.rotate(90, expand=True), (margin, title_h + size))
+    canvas.save(path)
+
 
 # -------------------------------------------------------------------
-# 3. Run through test set
+# 2. Collect the test set: (image path, true class index)
 # -------------------------------------------------------------------
-y_true = []
-y_pred = []
-
+samples = []
 for class_name in class_names:
     class_dir = TEST_DIR / class_name
-    for img_path in glob.glob(str(class_dir / "*")):
-        if not os.path.isfile(img_path):
-            continue
+    # scandir's DirEntry.is_file() reuses the readdir result, no stat per file;
+    # dotfiles are skipped the way glob("*") skipped them
+    with os.scandir(class_dir) as it:
+        for entry in it:
+            if entry.name.startswith(".") or not entry.is_file():
+                continue
+            samples.append((entry.path, label_to_idx[class_name]))
+
+# -------------------------------------------------------------------
+# 3. Prediction using your CLIP + FAISS
+# Embeds in batches, then runs a single FAISS search for every query.
+# We take the best FAISS match as the predicted class (no threshold
+# here so everything gets mapped to some class, which is what we want
+# for a confusion matrix).
+# -------------------------------------------------------------------
+class TestImages(Dataset):
+    """Decodes and CLIP-preprocesses test images inside DataLoader workers."""
 
-        true_idx = label_to_idx[class_name]
+    def __init__(self, samples, transform):
+        self.samples = samples
+        self.transform = transform
 
+    def __len__(self):
+        return len(self.samples)
+
+    def __getitem__(self, i):
+        img_path, true_idx = self.samples[i]
         try:
-            pred_label = predict_label(img_path)
+            img = Image.open(img_path).convert("RGB")
         except Exception as e:
             print(f"Error predicting {img_path}: {e}")
-            continue
-
-        if pred_label is None or pred_label not in label_to_idx:
-            # treat unknown / None as misclass (could also map to an 'Unknown' class)
-            continue
+            return None
+        return self.transform(img), true_idx
 
-        pred_idx = label_to_idx[pred_label]
-        y_true.append(true_idx)
-        y_pred.append(pred_idx)
 
-y_true = np.array(y_true)
-y_pred = np.array(y_pred)
+def collate_valid(items):
+    # Unreadable images come back as None and are dropped from the batch
+    items = [item for item in items if item is not None]
+    if not items:
+        return None
+    pixels, labels = zip(*items)
+    return torch.stack(pixels), list(labels)
+
+
+# Same resize/crop/normalize as the embedder, run on the CPU in the workers
+# while the model runs the previous batch. Workers are forked (Linux).
+preprocess = v2.Compose([v2.ToImage(), embedder.transform])
+loader = DataLoader(
+    TestImages(samples, preprocess),
+    batch_size=BATCH_SIZE,
+    num_workers=min(8, os.cpu_count() or 1),
+    pin_memory=embedder.device == "cuda",
+    prefetch_factor=4,
+    collate_fn=collate_valid,
+)
+
+true_labels = []
+embeddings = []
+for batch in loader:
+    if batch is None:
+        continue
+    pixels, labels = batch
+    embeddings.append(embedder.embed_pixel_values(pixels))
+    true_labels.extend(labels)
+
+if embeddings and search_engine.index.ntotal > 0:
+    rows = search_engine.search_top1_batch(np.concatenate(embeddings))
+
+    # FAISS row -> class index; the trailing -1 catches empty results (idx -1).
+    # Unknown / None predictions are treated as misclass and dropped
+    # (could also map to an 'Unknown' class).
+    row_to_label = np.array(
+        [label_to_idx.get(name, -1) for name in search_engine.place_names.tolist()] + [-1],
+        dtype=np.int32,
+    )
+    pred = row_to_label[rows]
+    keep = pred >= 0
+    y_true = np.array(true_labels)[keep]
+    y_pred = pred[keep]
+else:
+    # if DB empty or something weird
+    y_true = np.array([], dtype=int)
+    y_pred = np.array([], dtype=int)
 
 overall_acc = (y_true == y_pred).mean()
 print(f"Overall accuracy on augmented test set: {overall_acc:.4f}")
@@ -82,16 +165,14 @@ print(f"Overall accuracy on augmented test set: {overall_acc:.4f}")
 # -------------------------------------------------------------------
 # 4. Confusion matrix
 # -------------------------------------------------------------------
-cm = confusion_matrix(y_true, y_pred, labels=range(len(class_names)))
-
-fig, ax = plt.subplots(figsize=(10, 10))
-disp = ConfusionMatrixDisplay(confusion_matrix=cm,
-                              display_labels=class_names)
-disp.plot(include_values=False, xticks_rotation=90, ax=ax, cmap="Blues")
-ax.set_title("Confusion Matrix for PlaceAI (Augmented Test Set)")
-plt.tight_layout()
-plt.savefig("placeai_confusion_matrix.png", dpi=300)
-plt.close()
+# np.bincount over the flattened (true, pred) pair index: one pass, no
+# sklearn target validation
+num_classes = len(class_names)
+cm = np.bincount(num_classes * y_true + y_pred,
+                 minlength=num_classes * num_classes).reshape(num_classes, num_classes)
+
+render_confusion_matrix(cm, class_names, "placeai_confusion_matrix.png",
+                        "Confusion Matrix for PlaceAI (Augmented Test Set)")
 print("Saved placeai_confusion_matrix.png")
 
 # -------------------------------------------------------------------
@@ -1,81 +1,149 @@
 # generate_augmented_test_set.py
 
+import argparse
 import os
 import random
+from multiprocessing import Pool
 from pathlib import Path
 
-from PIL import Image, ImageEnhance, ImageFilter
+import cv2
+from PIL import Image
 import numpy as np
 
+try:
+    import simplejpeg  # libjpeg-turbo encoder; optional
+except ImportError:
+    simplejpeg = None
+
 SOURCE_DIR = Path("landmarks")
 TARGET_DIR = Path("test_augmented")
 AUG_PER_IMAGE = 4   # how many augmented copies per original
 
 TARGET_DIR.mkdir(exist_ok=True)
 
-def random_augment(img: Image.Image) -> Image.Image:
-    # slightly stronger rotation
+# PCG64 generator for the noise; reseeded per output in _aug_one
+_rng = np.random.default_rng()
+
+def random_augment(arr: np.ndarray) -> np.ndarray:
+    """Augment an HxWx3 uint8 RGB array; every stage runs as an OpenCV kernel."""
+    # slightly stronger rotation (counter-clockwise, canvas expanded to fit)
     angle = random.uniform(-35, 35)
-    img = img.rotate(angle, expand=True, fillcolor=(0, 0, 0))
+    h, w = arr.shape[:2]
+    m = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+    cos, sin = abs(m[0, 0]), abs(m[0, 1])
+    out_w, out_h = int(round(h * sin + w * cos)), int(round(h * cos + w * sin))
+    m[0, 2] += (out_w - w) / 2
+    m[1, 2] += (out_h - h) / 2
+    arr = cv2.warpAffine(arr, m, (out_w, out_h), flags=cv2.INTER_NEAREST,
+                         borderMode=cv2.BORDER_CONSTANT, borderValue=(0, 0, 0))
 
     # more aggressive random crop (55–100% area)
-    w, h = img.size
+    h, w = arr.shape[:2]
     scale = random.uniform(0.55, 1.0)
     new_w, new_h = int(w * scale), int(h * scale)
     left = random.randint(0, max(0, w - new_w))
     top = random.randint(0, max(0, h - new_h))
-    img = img.crop((left, top, left + new_w, top + new_h))
-    img = img.resize((w, h))
+    arr = cv2.resize(arr[top:top + new_h, left:left + new_w], (w, h), interpolation=cv2.INTER_CUBIC)
 
-    # brightness + contrast (a bit wider range)
-    img = ImageEnhance.Brightness(img).enhance(random.uniform(0.45, 1.6))
-    img = ImageEnhance.Contrast(img).enhance(random.uniform(0.45, 1.6))
+    # brightness + contrast (a bit wider range); same blends as ImageEnhance:
+    # brightness scales towards black, contrast towards the mean luminance
+    brightness = random.uniform(0.45, 1.6)
+    arr = cv2.addWeighted(arr, brightness, arr, 0, 0)
+    contrast = random.uniform(0.45, 1.6)
+    mean = cv2.cvtColor(arr, cv2.COLOR_RGB2GRAY).mean()
+    arr = cv2.addWeighted(arr, contrast, arr, 0, (1 - contrast) * mean)
 
-    # blur fairly often
+    # blur fairly often (PIL's blur radius is the Gaussian sigma)
     if random.random() < 0.75:
-        img = img.filter(ImageFilter.GaussianBlur(radius=random.uniform(2.5, 5.0)))
+        arr = cv2.GaussianBlur(arr, (0, 0), sigmaX=random.uniform(2.5, 5.0))
 
     # noise: mostly moderate, sometimes strong
     if random.random() < 0.9:
-        arr = np.array(img).astype("float32")
         # 80% of the time: std ~22, 20% of the time: std ~35
         if random.random() < 0.8:
             noise_std = 22
         else:
             noise_std = 35
-        noise = np.random.normal(0, noise_std, arr.shape)
-        arr = np.clip(arr + noise, 0, 255).astype("uint8")
-        img = Image.fromarray(arr)
-
-    return img
-
+        # One float32 buffer, updated in place (no float64 noise array or
+        # extra float copy of the image)
+        buf = _rng.standard_normal(arr.shape, dtype=np.float32)
+        buf *= noise_std
+        buf += arr
+        np.clip(buf, 0, 255, out=buf)
+        arr = buf.astype("uint8")
+
+    return arr
+
+
+def save_jpeg(arr: np.ndarray, out_path: Path, quality: int = 85):
+    # Write next to the target and rename into place, so an interrupted run
+    # never leaves a truncated JPEG that a resumed run would count as done
+    tmp_path = out_path.with_suffix(".tmp")
+    if simplejpeg is None:
+        Image.fromarray(arr).save(tmp_path, format="JPEG", quality=quality)
+    else:
+        # Same 4:2:0 subsampling Pillow uses at this quality
+        data = simplejpeg.encode_jpeg(np.ascontiguousarray(arr), quality=quality,
+                                      colorspace="RGB", colorsubsampling="420")
+        tmp_path.write_bytes(data)
+    os.replace(tmp_path, out_path)
+
+
+def _aug_one(task):
+    """Write the missing augmented copies of one image (runs in a worker)."""
+    global _rng
+    src_path, dst_class_dir, seed = task
+    stem = src_path.stem
+    out_paths = [dst_class_dir / f"{stem}_aug{i+1}.jpg" for i in range(AUG_PER_IMAGE)]
+    # Outputs from an earlier run are kept; only decode if something is missing
+    if all(out_path.exists() for out_path in out_paths):
+        return []
+
+    try:
+        arr = np.asarray(Image.open(src_path).convert("RGB"))
+    except Exception as e:
+        return [f"Skipping {src_path}: {e}"]
+
+    messages = []
+    for i, out_path in enumerate(out_paths):
+        if out_path.exists():
+            continue
+        # Seed from (seed, class, stem, i) so each output is reproducible on
+        # its own, regardless of worker or which outputs a resumed run skips
+        random.seed(f"{seed}:{dst_class_dir.name}/{stem}:{i}")
+        _rng = np.random.default_rng(random.getrandbits(64))
+        aug_arr = random_augment(arr)
+        save_jpeg(aug_arr, out_path, quality=85)
+        messages.append(f"Saved {out_path}")
+    return messages
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Generate an augmented test set from SOURCE_DIR.")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="base seed for the augmentations (default: 0)")
+    args = parser.parse_args()
+
+    tasks = []
     for class_name in sorted(d for d in os.listdir(SOURCE_DIR)
                              if (SOURCE_DIR / d).is_dir()):
         src_class_dir = SOURCE_DIR / class_name
         dst_class_dir = TARGET_DIR / class_name
         dst_class_dir.mkdir(parents=True, exist_ok=True)
 
-        for fname in os.listdir(src_class_dir):
+        for fname in sorted(os.listdir(src_class_dir)):
             src_path = src_class_dir / fname
             if not src_path.is_file():
                 continue
-
-            try:
-                img = Image.open(src_path).convert("RGB")
-            except Exception as e:
-                print(f"Skipping {src_path}: {e}")
-                continue
-
-            stem = src_path.stem
-            for i in range(AUG_PER_IMAGE):
-                aug_img = random_augment(img)
-                out_name = f"{stem}_aug{i+1}.jpg"
-                out_path = dst_class_dir / out_name
-                aug_img.save(out_path, quality=85)
-                print(f"Saved {out_path}")
+            tasks.append((src_path, dst_class_dir, args.seed))
+
+    # Augmentation is CPU-bound OpenCV/NumPy work, so spread images over
+    # processes; each worker runs OpenCV single-threaded so the pool doesn't
+    # start cpu_count() thread pools of cpu_count() threads each
+    with Pool(os.cpu_count(), initializer=cv2.setNumThreads, initargs=(1,)) as pool:
+        for messages in pool.imap_unordered(_aug_one, tasks, chunksize=16):
+            for message in messages:
+                print(message)
 
 if __name__ == "__main__":
     main()
@@ -6,59 +6,262 @@ Compares query image embeddings against reference database.
 import faiss
 import numpy as np
 from typing import Tuple, List, Dict
+import json
 import os
 import pickle
+import threading
+from contextlib import contextmanager
+
+
+class _ReadWriteLock:
+    """Any number of concurrent readers or one writer; waiting writers block new readers."""
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
 
 
 class ImageSearch:
     """FAISS-based image similarity search."""
     
-    def __init__(self, db_path: str = "data/landmarks_db.faiss", metadata_path: str = "data/landmarks_metadata.pkl"):
+    def __init__(self, db_path: str = "data/landmarks_db.faiss", metadata_path: str = "data/landmarks_metadata.json",
+                 use_gpu: bool = False, read_only: bool = False):
         """
         Initialize image search with FAISS index.
         
         Args:
             db_path: Path to FAISS index file
-            metadata_path: Path to metadata pickle file
+            metadata_path: Path to metadata JSON sidecar file
+            use_gpu: Search on GPU 0 when faiss-gpu and a GPU are available
+            read_only: Never write the index back (for query-only tools like
+                       evaluation). Only IVF inverted lists are memory-mapped;
+                       a flat index is still read fully into RAM
         """
         self.db_path = db_path
         self.metadata_path = metadata_path
+        self.use_gpu = use_gpu
+        self.read_only = read_only
         self.index = None
+        self._gpu_res = None
         self.metadata = []
+        self._names = set()  # place_names present in metadata, for O(1) duplicate checks
+        self._place_names = None  # cached place_names array, see the property
         self.dimension = 512  # CLIP ViT-B/32 embedding dimension
+
+        # Past this many vectors the exhaustive scan is replaced by a trained
+        # OPQ + IVF + PQ index that only visits nprobe cells per query
+        self.ivf_threshold = 10_000
+        self.nprobe = 16
+        # Vectors needed before int8 ranges are fitted to the data
+        self.sq_min_train = 1_000
+
+        # Debounced background saves (see _schedule_save)
+        self.save_interval = 1.0  # seconds
+        # _lock serializes adds, relabels and saves with each other; the index
+        # and metadata themselves are only changed under _rw.write(), so
+        # searches (_rw.read()) run in parallel and never wait on a save.
+        # Lock order: _lock before _rw.
+        self._lock = threading.RLock()
+        self._rw = _ReadWriteLock()
+        self._save_timer = None
         
         self._load_database()
     
     def _load_database(self):
         """Load FAISS index and metadata from disk."""
         try:
+            legacy_path = os.path.splitext(self.metadata_path)[0] + ".pkl"
+            io_flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if self.read_only else 0
             if os.path.exists(self.db_path) and os.path.exists(self.metadata_path):
-                self.index = faiss.read_index(self.db_path)
-                with open(self.metadata_path, 'rb') as f:
+                self.index = faiss.read_index(self.db_path, io_flags)
+                with open(self.metadata_path, 'r', encoding='utf-8') as f:
+                    self.metadata = json.load(f)
+            elif os.path.exists(self.db_path) and os.path.exists(legacy_path):
+                # Metadata written by older builds; saved as JSON on the next write
+                self.index = faiss.read_index(self.db_path, io_flags)
+                with open(legacy_path, 'rb') as f:
                     self.metadata = pickle.load(f)
-                print(f"Loaded database with {self.index.ntotal} landmarks.")
             else:
-                # Create empty index
-                self.index = faiss.IndexFlatL2(self.dimension)
-                print("Created new empty database.")
+                self.index = None
         except Exception as e:
-            print(f"Error loading database: {e}")
-            self.index = faiss.IndexFlatL2(self.dimension)
+            # Start empty, but never save over files that exist and failed to
+            # load: an empty index written back would destroy them
+            print(f"Error loading database: {e}; continuing with an empty, unsaved index")
+            self.index = None
+            self.metadata = []
+            self.read_only = True
+
+        if self.index is not None:
+            try:
+                self._upgrade_index()
+            except Exception as e:
+                # The index as read is still valid; keep serving from it
+                print(f"Error upgrading database index: {e}")
+            if not isinstance(self.index, (faiss.IndexScalarQuantizer, faiss.IndexFlat)):
+                faiss.extract_index_ivf(self.index).nprobe = self.nprobe
+            print(f"Loaded database with {self.index.ntotal} landmarks.")
+        else:
+            # Create empty index
+            self.index = self._new_index()
+            print("Created new empty database.")
+
+        self._names = {md.get("place_name") for md in self.metadata}
+        self._place_names = None
+
+        if self.use_gpu and faiss.get_num_gpus() > 0:
+            self.index = self._index_to_gpu(self.index)
+            print("Moved FAISS index to GPU 0.")
+
+    def _upgrade_index(self):
+        """Bring an index written by an older build (or grown past ivf_threshold) up to date."""
+        if isinstance(self.index, faiss.IndexFlat) or (
+                isinstance(self.index, faiss.IndexScalarQuantizer)
+                and self.index.sq.qtype != faiss.ScalarQuantizer.QT_8bit):
+            # Migrate flat / FP16 indexes; the int8 copy is persisted on the next save.
+            vectors = self.index.reconstruct_n(0, self.index.ntotal)
+            index = self._new_index(vectors)
+            index.add(vectors)
+            self.index = index
+        elif self._on_fixed_box(self.index) and self.index.ntotal >= self.sq_min_train:
+            # int8 index from a build that trained on a fixed box, or one that
+            # grew past sq_min_train: refit the ranges to the stored vectors
+            self.index = self._refit_index(self.index)
+        if (not self.read_only and isinstance(self.index, faiss.IndexScalarQuantizer)
+                and self.index.ntotal > self.ivf_threshold):
+            self.index = self._train_ivf(self.index)
+            self._write_database()
+
+    def _refit_index(self, index, extra: np.ndarray = None):
+        """Copy of an int8 index with its ranges fitted to its vectors (plus extra, unadded)."""
+        vectors = index.reconstruct_n(0, index.ntotal)
+        if extra is not None:
+            vectors = np.concatenate([vectors, extra])
+        refit = self._new_index(vectors)
+        refit.add(vectors[:index.ntotal])
+        return refit
+
+    def _train_ivf(self, index):
+        """Rebuild a flat index as a trained OPQ32,IVF,PQ32 index over the same vectors."""
+        vectors = index.reconstruct_n(0, index.ntotal)
+        # FAISS wants >= 39 training points per centroid; capped at 1024 cells
+        nlist = min(1024, len(vectors) // 39)
+        print(f"Training IVF index ({nlist} cells) on {len(vectors)} landmarks...")
+        ivf = faiss.index_factory(self.dimension, f"OPQ32,IVF{nlist},PQ32", faiss.METRIC_INNER_PRODUCT)
+        ivf.train(vectors)
+        ivf.add(vectors)
+        return ivf
+
+    def _index_to_gpu(self, index):
+        if isinstance(index, faiss.IndexScalarQuantizer):
+            # GPU FAISS has no flat scalar-quantizer index, so search a
+            # full-precision flat copy of the vectors instead
+            flat = faiss.IndexFlatIP(self.dimension)
+            if index.ntotal:
+                flat.add(index.reconstruct_n(0, index.ntotal))
+            index = flat
+        self._gpu_res = faiss.StandardGpuResources()
+        return faiss.index_cpu_to_gpu(self._gpu_res, 0, index)
+
+    def _cpu_index(self):
+        """The index in its on-disk (CPU) form."""
+        if self._gpu_res is None:
+            return self.index
+        index = faiss.index_gpu_to_cpu(self.index)
+        if isinstance(index, faiss.IndexFlat):
+            # Re-quantize the full-precision GPU copy to int8
+            vectors = index.reconstruct_n(0, index.ntotal) if index.ntotal else None
+            sq = self._new_index(vectors)
+            if vectors is not None:
+                sq.add(vectors)
+            return sq
+        return index
+
+    def _new_index(self, vectors: np.ndarray = None):
+        """
+        Inner-product index storing vectors as int8 (a quarter of the memory of flat FP32).
+        
+        Args:
+            vectors: Stored vectors to fit the per-dimension quantizer ranges
+                     to; with fewer than sq_min_train, a fixed box is used
+        """
+        index = faiss.IndexScalarQuantizer(
+            self.dimension, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT
+        )
+        if vectors is not None and len(vectors) >= self.sq_min_train:
+            # Per-dimension min/max of the data, widened by 20% either side
+            # so later adds rarely clip. CLIP components are ~±0.04 RMS, so
+            # this spends the 256 levels where the values actually are.
+            index.sq.rangestat = faiss.ScalarQuantizer.RS_minmax
+            index.sq.rangestat_arg = 0.2
+            index.train(np.ascontiguousarray(vectors, dtype='float32'))
+        else:
+            # Too little data to fit: a fixed ±0.5 box holds practically every
+            # component of a unit CLIP vector; refit once the DB has grown
+            bounds = np.array([[-0.5] * self.dimension, [0.5] * self.dimension], dtype='float32')
+            index.train(bounds)
+        return index
+
+    def _on_fixed_box(self, index) -> bool:
+        """True for an int8 index whose ranges were not fitted to data (see _new_index)."""
+        if not isinstance(index, faiss.IndexScalarQuantizer):
+            return False
+        vmin = faiss.vector_to_array(index.sq.trained)[:self.dimension]
+        return bool(np.all(vmin == vmin[0]))
     
     def _save_database(self):
         """Save FAISS index and metadata to disk."""
+        with self._lock:
+            self._save_timer = None
+            self._write_database()
+
+    def _write_database(self):
+        if self.read_only:
+            return
         try:
             os.makedirs(os.path.dirname(self.db_path) if os.path.dirname(self.db_path) else ".", exist_ok=True)
-            faiss.write_index(self.index, self.db_path)
-            with open(self.metadata_path, 'wb') as f:
-                pickle.dump(self.metadata, f)
+            faiss.write_index(self._cpu_index(), self.db_path)
+            with open(self.metadata_path, 'w', encoding='utf-8') as f:
+                json.dump(self.metadata, f)
             print(f"Saved database with {self.index.ntotal} landmarks.")
         except Exception as e:
             print(f"Error saving database: {e}")
     
     def add_landmark(self, embedding: np.ndarray, place_name: str, image_path: str = None):
         """
-        Add a landmark to the database.
+        Add a landmark to the database and save it.
+        
+        Callers adding many landmarks should use add_landmarks_batch().
         
         Args:
             embedding: Normalized embedding vector
@@ -67,63 +270,213 @@ class ImageSearch:
         """
         if embedding.shape[0] != self.dimension:
             raise ValueError(f"Embedding dimension mismatch: expected {self.dimension}, got {embedding.shape[0]}")
+
+        self.add_landmarks_batch(embedding.reshape(1, -1), [place_name], [image_path])
+
+    def flush(self):
+        """Save the database now, e.g. after add_landmarks_batch(defer_save=True)."""
+        with self._lock:
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+            self._save_database()
+
+    def add_landmarks_batch(self, embeddings: np.ndarray, place_names: List[str], image_paths: List[str] = None,
+                            defer_save: bool = False) -> int:
+        """
+        Add many landmarks with a single index.add() and one save.
         
-        # Ensure embedding is float32 and normalized
-        embedding = embedding.astype('float32').reshape(1, -1)
-        
-        # Prevent adding duplicates for the same place_name
-        for md in self.metadata:
-            if md.get("place_name") == place_name:
+        Args:
+            embeddings: (N, dimension) array of normalized embedding vectors
+            place_names: N place names
+            image_paths: Optional N reference image paths
+            defer_save: Skip the save; the caller persists with flush()
+            
+        Returns:
+            Number of landmarks actually added (duplicates are skipped)
+        """
+        embeddings = np.asarray(embeddings)
+        if embeddings.ndim != 2 or embeddings.shape[1] != self.dimension:
+            raise ValueError(f"Embedding dimension mismatch: expected (N, {self.dimension}), got {embeddings.shape}")
+        if image_paths is None:
+            image_paths = [None] * len(place_names)
+
+        with self._lock:
+            added = self._add_batch(embeddings, place_names, image_paths)
+            if added and not defer_save:
+                self._save_database()
+        return added
+
+    def _add_batch(self, embeddings: np.ndarray, place_names: List[str], image_paths: List[str]) -> int:
+        # One entry per place_name, including duplicates within the batch
+        batch_names = set()
+        keep = []
+        for i, place_name in enumerate(place_names):
+            if place_name in self._names or place_name in batch_names:
                 print(f"Skipping add: {place_name} already exists in FAISS metadata")
-                return
+                continue
+            batch_names.add(place_name)
+            keep.append(i)
+        if not keep:
+            return 0
 
-        # Add to index
-        self.index.add(embedding)
-        
-        # Add metadata
-        self.metadata.append({
-            "place_name": place_name,
-            "image_path": image_path,
-            "index": self.index.ntotal - 1
-        })
+        # One contiguous float32 block, re-normalized in place by FAISS
+        vectors = np.ascontiguousarray(embeddings[keep], dtype='float32')
+        faiss.normalize_L2(vectors)
+        with self._rw.write():
+            start = self.index.ntotal
+            if self._on_fixed_box(self.index) and start + len(vectors) >= self.sq_min_train:
+                # Enough data now to fit the int8 ranges (one-off)
+                self.index = self._refit_index(self.index, vectors)
+            self.index.add(vectors)
+            for offset, i in enumerate(keep):
+                self.metadata.append({
+                    "place_name": place_names[i],
+                    "image_path": image_paths[i],
+                    "index": start + offset
+                })
+            self._place_names = None
+        self._names.update(batch_names)
+        return len(keep)
+
+    def relabel_landmark(self, image_path: str, place_name: str, new_image_path: str = None) -> bool:
+        """
+        Point an indexed image at a new place (and path) without re-embedding it.
         
-        self._save_database()
+        Args:
+            image_path: Path the image was indexed under
+            place_name: New place name for its vector
+            new_image_path: New path of the image, if it moved
+            
+        Returns:
+            True if the image was in the index, False otherwise
+        """
+        with self._lock:
+            for md in self.metadata:
+                if md.get("image_path") == image_path:
+                    with self._rw.write():
+                        old_name, md["place_name"] = md.get("place_name"), place_name
+                        if new_image_path is not None:
+                            md["image_path"] = new_image_path
+                        self._place_names = None
+                    self._names.add(place_name)
+                    if not any(m.get("place_name") == old_name for m in self.metadata):
+                        self._names.discard(old_name)
+                    self._schedule_save()
+                    return True
+        return False
+
+    def _schedule_save(self):
+        """Persist the index after save_interval, coalescing writes in between."""
+        with self._lock:
+            if self._save_timer is None:
+                self._save_timer = threading.Timer(self.save_interval, self._save_database)
+                self._save_timer.start()
     
+    @property
+    def place_names(self) -> np.ndarray:
+        """
+        place_name of every indexed vector as one contiguous array, by FAISS row.
+        
+        Lets callers map search results with a single fancy-index gather
+        instead of a dict lookup per row; rebuilt lazily after metadata changes.
+        """
+        with self._rw.read():
+            return self._names_array()
+
+    def _names_array(self) -> np.ndarray:
+        # Caller holds _rw (read or write). Concurrent readers may both
+        # rebuild; they build the same array.
+        names = self._place_names
+        if names is None:
+            names = np.array([md.get("place_name") for md in self.metadata], dtype=str)
+            self._place_names = names
+        return names
+
+    @contextmanager
+    def _search_lock(self):
+        # CPU FAISS searches are safe to run concurrently; a GPU index
+        # shares one StandardGpuResources, so its searches take turns
+        with (self._rw.write() if self._gpu_res is not None else self._rw.read()):
+            yield
+
     def search(self, query_embedding: np.ndarray, k: int = 5) -> List[Dict]:
         """
         Search for similar landmarks.
         
         Args:
-            query_embedding: Normalized embedding vector of query image
+            query_embedding: Normalized embedding vector of query image, or an
+                             (N, dimension) matrix of N query vectors
             k: Number of results to return
             
         Returns:
             List of dictionaries with place_name, confidence, and metadata
+            (one such list per query for matrix input)
         """
+        batched = query_embedding.ndim == 2
         if self.index.ntotal == 0:
-            return []
+            return [[] for _ in range(len(query_embedding))] if batched else []
         
-        # Ensure embedding is float32 and normalized
-        query_embedding = query_embedding.astype('float32').reshape(1, -1)
+        queries = self._prepare_queries(query_embedding)
         
         # Search
-        distances, indices = self.index.search(query_embedding, min(k, self.index.ntotal))
+        with self._search_lock():
+            distances, indices = self.index.search(queries, min(k, self.index.ntotal))
+            names = self._names_array()
+        
+        per_query = [self._build_results(names, d, i) for d, i in zip(distances, indices)]
+        return per_query if batched else per_query[0]
+
+    def search_top1_batch(self, queries: np.ndarray) -> np.ndarray:
+        """
+        Best match for each query as a bare FAISS row, for bulk scoring.
+        
+        Skips result dicts and score conversion; map rows to names with
+        place_names[rows].
+        
+        Args:
+            queries: (N, dimension) matrix of query vectors
+            
+        Returns:
+            (N,) int64 array of row indices (-1 where there is no match)
+        """
+        queries = self._prepare_queries(queries)
+        with self._search_lock():
+            _, indices = self.index.search(queries, 1)
+        return indices[:, 0]
+
+    @staticmethod
+    def _prepare_queries(query_embedding: np.ndarray) -> np.ndarray:
+        """(N, d) C-contiguous unit-norm float32 queries, copying only if needed."""
+        # No-ops (views) for float32 contiguous input, the usual embedder output
+        queries = np.ascontiguousarray(query_embedding, dtype='float32')
+        if queries.ndim == 1:
+            queries = queries[np.newaxis, :]
+        # Normalize into a new array only when the input isn't already
+        # unit-norm, so the caller's array is never modified
+        sq_norms = np.einsum('ij,ij->i', queries, queries)
+        if not np.allclose(sq_norms, 1.0, atol=1e-4):
+            queries = queries / np.sqrt(np.maximum(sq_norms, 1e-12))[:, np.newaxis]
+        return queries
+
+    def _build_results(self, names: np.ndarray, distances: np.ndarray, rows: np.ndarray) -> List[Dict]:
+        # Drop empty slots (-1, e.g. from IVF) and gather all names at once
+        found = (rows >= 0) & (rows < len(names))
+        rows, distances = rows[found], distances[found]
         
         results = []
-        for i, (distance, idx) in enumerate(zip(distances[0], indices[0])):
-            if idx < len(self.metadata):
-                # Convert L2 distance to similarity (cosine similarity for normalized vectors)
-                # For normalized vectors, L2 distance relates to cosine similarity:
-                # cosine_sim = 1 - (L2_distance^2 / 2)
-                similarity = max(0.0, 1.0 - (distance / 2.0))
-                
-                result = {
-                    "place_name": self.metadata[idx]["place_name"],
-                    "confidence": float(similarity),
-                    "distance": float(distance),
-                    "metadata": self.metadata[idx]
-                }
-                results.append(result)
+        for place_name, distance, idx in zip(names[rows], distances, rows):
+            # Inner product of normalized vectors is the cosine similarity;
+            # report the equivalent squared L2 distance: 2 - 2 * cos
+            similarity = min(1.0, max(0.0, float(distance)))
+            distance = max(0.0, 2.0 - 2.0 * float(distance))
+            
+            result = {
+                "place_name": str(place_name),
+                "confidence": float(similarity),
+                "distance": float(distance),
+                "metadata": self.metadata[idx]
+            }
+            results.append(result)
         
         return results
     
@@ -146,12 +499,17 @@ class ImageSearch:
 
 # Global instance
 _search_engine = None
+_search_engine_lock = threading.Lock()
 
 
 def get_search_engine() -> ImageSearch:
     """Get or create global search engine instance."""
     global _search_engine
     if _search_engine is None:
-        _search_engine = ImageSearch()
+        # Two instances would each load (and possibly retrain and write) the
+        # index, and one's adds would be lost, so build under a lock
+        with _search_engine_lock:
+            if _search_engine is None:
+                _search_engine = ImageSearch()
     return _search_engine
 
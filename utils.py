@@ -1,22 +1,44 @@
+import itertools
 import os
 import shutil
-from datetime import datetime
-from typing import Tuple
+import time
+from functools import lru_cache
+from typing import Iterable, List, Tuple, Union
 import re
 
+from PIL import Image
+
 ALLOWED_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+_NAME_SEPARATORS = re.compile(r"[_\s]+")
+_upload_counter = itertools.count()
 
 
+@lru_cache(maxsize=4096)
 def normalize_name(name: str) -> str:
     """Normalize landmark name to Title_Case_With_Underscores."""
     if not name:
         return "Unknown"
 
-    # Replace underscores with spaces, normalize spacing
-    cleaned = re.sub(r"[_\s]+", " ", name.strip())
+    # Split on runs of underscores/whitespace and title-case each word
+    words = _NAME_SEPARATORS.split(name.strip())
+    return "_".join(word.capitalize() for word in words if word)
+
+
+def normalize_names(names: Iterable[str]) -> List[str]:
+    """Normalize many landmark names at once (startup sync, build_db)."""
+    return list(map(normalize_name, names))
+
 
-    # Title-case each word
-    return "_".join(word.capitalize() for word in cleaned.split())
+def fast_decode(image: Union[Image.Image, str], target: int = 256) -> Image.Image:
+    """Decode an image to RGB for embedding, letting libjpeg downscale on the fly.
+
+    JPEGs are decoded at the smallest 1/2, 1/4 or 1/8 scale that is still at
+    least target px on each side; other formats decode at full size.
+    """
+    if not isinstance(image, Image.Image):
+        image = Image.open(image)
+    image.draft("RGB", (target, target))
+    return image.convert("RGB")
 
 
 def ensure_folder(path: str):
@@ -29,14 +51,18 @@ def is_allowed_file(filename: str) -> bool:
     return ext in ALLOWED_EXTENSIONS
 
 
+def unique_filename(filename: str) -> str:
+    """Prefix filename with a ns timestamp + process counter so bursts never collide."""
+    return f"{time.time_ns()}_{next(_upload_counter)}_{os.path.basename(filename)}"
+
+
 def save_uploaded_image(file, folder: str) -> str:
     """Save uploaded file into folder, return saved filepath.
 
     The filename uses a timestamp to avoid collisions.
     """
     ensure_folder(folder)
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"{timestamp}_{os.path.basename(file.filename)}"
+    filename = unique_filename(file.filename)
     filepath = os.path.join(folder, filename)
     # Use shutil.copyfileobj to stream from UploadFile.file
     file.file.seek(0)